@@ -1,8 +1,10 @@
 import streamlit as st
 import pandas as pd
-import requests
+import httpx
+import orjson
 import plotly.graph_objects as go
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import os
 
 # --- Page Configuration ---
@@ -18,33 +20,73 @@ API_HOST = os.getenv("API_BACKEND_HOST", "127.0.0.1")
 API_PREDICT_URL = f"http://{API_HOST}:8000/predict"
 API_HISTORICAL_URL = f"http://{API_HOST}:8000/historical-data"
 
+# --- HTTP Client ---
+@st.cache_resource
+def get_client() -> httpx.Client:
+    """
+    Creates a shared httpx client so calls to the backend reuse
+    keep-alive connections instead of opening a new one per request.
+    Cached as a resource so it survives Streamlit reruns.
+    """
+    transport = httpx.HTTPTransport(
+        retries=2,
+        limits=httpx.Limits(max_connections=10, max_keepalive_connections=10)
+    )
+    return httpx.Client(transport=transport, timeout=300)
+
+CLIENT = get_client()
+
 # --- Helper Functions ---
-def get_forecast(ticker: str, days: int):
-    """Calls the FastAPI backend to get a forecast."""
+class ModelTrainingError(Exception):
+    """Raised when the backend is still training the requested model."""
+
+# The cached fetchers raise on failure, and Streamlit never caches a call
+# that raises, so only successful responses are kept for the TTL.
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_forecast(ticker: str, days: int):
+    """Calls the FastAPI backend to get a forecast (cached)."""
     params = {"ticker": ticker, "days": days}
+    with CLIENT.stream("GET", API_PREDICT_URL, params=params) as response:
+        # Error and 202 replies are a single JSON object, so read them in full
+        if response.is_error or response.status_code == 202:
+            response.read()
+        response.raise_for_status()
+        # 202 means training was queued; raise so the reply isn't cached
+        if response.status_code == 202:
+            raise ModelTrainingError(response.json().get('detail', 'The model is being trained.'))
+        # The forecast is streamed as newline-delimited JSON
+        return [orjson.loads(line) for line in response.iter_lines() if line]
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_historical_data(ticker: str):
+    """Calls the FastAPI backend to get historical data (cached)."""
+    params = {"ticker": ticker}
+    response = CLIENT.get(API_HISTORICAL_URL, params=params)
+    response.raise_for_status()
+    return response.json()
+
+def get_forecast(ticker: str, days: int):
+    """Gets a forecast, converting failures into an error dict."""
     try:
-        response = requests.get(API_PREDICT_URL, params=params, timeout=300)
-        response.raise_for_status() 
-        return response.json()
-    except requests.exceptions.HTTPError as err:
+        return fetch_forecast(ticker.upper(), days)
+    except ModelTrainingError as e:
+        return {"error": f"{e} Click 'Get Forecast' again in a minute."}
+    except httpx.HTTPStatusError as err:
         try:
             return {"error": err.response.json().get('detail', 'Unknown error')}
         except:
             return {"error": f"HTTP error: {err}"}
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         return {"error": "Connection Error: Could not connect to the API. Is it running?"}
-    except requests.exceptions.Timeout:
-        return {"error": "Timeout: The request took too long. The model might be training."}
+    except httpx.TimeoutException:
+        return {"error": "Timeout: The API took too long to respond. It may be overloaded or unreachable."}
     except Exception as e:
         return {"error": f"An unknown error occurred: {e}"}
 
 def get_historical_data(ticker: str):
-    """Calls the FastAPI backend to get historical data."""
-    params = {"ticker": ticker}
+    """Gets historical data, converting failures into an error dict."""
     try:
-        response = requests.get(API_HISTORICAL_URL, params=params, timeout=300)
-        response.raise_for_status()
-        return response.json()
+        return fetch_historical_data(ticker.upper())
     except Exception as e:
         return {"error": f"Could not fetch historical data: {e}"}
 
@@ -62,9 +104,13 @@ if st.button("Get Forecast", type="primary"):
         st.error("Please enter a stock ticker.")
     else:
         # Show a spinner while fetching BOTH data sources
+        # Both calls are independent, so run them concurrently
         with st.spinner(f"Fetching data and forecast for {ticker}..."):
-            forecast_data = get_forecast(ticker, days)
-            historical_data = get_historical_data(ticker)
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                forecast_future = executor.submit(get_forecast, ticker, days)
+                historical_future = executor.submit(get_historical_data, ticker)
+                forecast_data = forecast_future.result()
+                historical_data = historical_future.result()
         
         # Check for errors in both requests
         if "error" in forecast_data:
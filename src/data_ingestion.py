@@ -1,13 +1,45 @@
+import io
 import yfinance as yf
 import pandas as pd
+from datetime import date
 from pathlib import Path
 
 # Import from our other src files
-from .utils import read_config
+from .utils import read_config, write_atomic, KeyedLocks
+
+# Tracks which files were already brought up to date today, so repeat
+# calls skip the download entirely. Guarded by a lock per output file so
+# simultaneous requests for the same ticker only download once.
+_fetched_on = {}
+_fetch_locks = KeyedLocks()
+
+def _flatten_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Drops the 'Ticker' level yfinance adds to the column headers."""
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    return df
+
+def _read_existing(output_path: Path):
+    """
+    Reads previously saved data for a ticker, falling back to a legacy CSV
+    next to the Parquet path. Returns (DataFrame or None, is_legacy).
+    """
+    if output_path.exists():
+        return pd.read_parquet(output_path), False
+    legacy_path = output_path.with_suffix('.csv')
+    if legacy_path.exists():
+        df = _flatten_columns(pd.read_csv(legacy_path, header=[0, 1], index_col=0, parse_dates=True))
+        # Coerce the whole block in one call so the Parquet file is always
+        # numeric and readers never need to clean it again
+        df = df.apply(pd.to_numeric, errors='coerce')
+        return df, True
+    return None, False
 
 def fetch_data(ticker: str, start_date: str, end_date: str, output_path: Path):
     """
-    Fetches historical stock data from Yahoo Finance and saves it to a CSV file.
+    Fetches historical stock data from Yahoo Finance and saves it to a Parquet file.
+    If the file already exists, only the rows after its last date are
+    downloaded and appended.
 
     Args:
         ticker (str): The stock ticker symbol (e.g., 'SPY').
@@ -15,23 +47,52 @@ def fetch_data(ticker: str, start_date: str, end_date: str, output_path: Path):
         end_date (str): The end date for the data in 'YYYY-MM-DD' format.
         output_path (Path): The file path to save the downloaded data.
     """
-    try:
-        print(f"Fetching data for {ticker} from {start_date} to {end_date}...")
-        data = yf.download(ticker, start=start_date, end=end_date)
-        
-        if data.empty:
-            print(f"Warning: No data found for ticker {ticker}. It may be invalid.")
+    output_path = output_path.with_suffix('.parquet')
+    with _fetch_locks.hold(output_path):
+        today = date.today()
+        if _fetched_on.get(output_path) == today:
+            print(f"Data for {ticker} already updated today.")
             return
-
-        # Ensure the output directory exists before saving
-        output_path.parent.mkdir(parents=True, exist_ok=True)
         
-        # Save the data to the specified path
-        data.to_csv(output_path)
-        print(f"Data successfully saved to {output_path}")
+        try:
+            existing, is_legacy = _read_existing(output_path)
+            data = existing
+            if existing is not None:
+                start_date = (existing.index.max() + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+            if existing is not None and start_date >= min(end_date, today.strftime('%Y-%m-%d')):
+                print(f"Data for {ticker} is already up to date.")
+            else:
+                print(f"Fetching data for {ticker} from {start_date} to {end_date}...")
+                new_data = yf.download(ticker, start=start_date, end=end_date)
+                
+                if new_data.empty and existing is None:
+                    print(f"Warning: No data found for ticker {ticker}. It may be invalid.")
+                    return
+                
+                if new_data.empty:
+                    print(f"No new data for {ticker}.")
+                elif existing is not None:
+                    data = pd.concat([existing, _flatten_columns(new_data)])
+                    data = data[~data.index.duplicated(keep='last')]
+                else:
+                    data = _flatten_columns(new_data)
+
+            # Only write when there is something new or a legacy CSV to convert
+            if data is not existing or is_legacy:
+                # Ensure the output directory exists before saving
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                
+                # Save the data to the specified path. Readers load it without
+                # this lock, so replace the file atomically rather than in place
+                buffer = io.BytesIO()
+                data.to_parquet(buffer, engine='pyarrow')
+                write_atomic(output_path, buffer.getvalue())
+                print(f"Data successfully saved to {output_path}")
+            _fetched_on[output_path] = today
 
-    except Exception as e:
-        print(f"An error occurred: {e}")
+        except Exception as e:
+            print(f"An error occurred: {e}")
 
 # This block allows us to test the function directly by running this script
 if __name__ == '__main__':
@@ -46,7 +107,7 @@ if __name__ == '__main__':
         END_DATE = params['end_date']
         
         # Define the output path
-        OUTPUT_PATH = Path(__file__).resolve().parent.parent / "data" / f"{TICKER}_data.csv"
+        OUTPUT_PATH = Path(__file__).resolve().parent.parent / "data" / f"{TICKER}_data.parquet"
         
         # Call the function with parameters from the config file
         fetch_data(ticker=TICKER, start_date=START_DATE, end_date=END_DATE, output_path=OUTPUT_PATH)
\ No newline at end of file
@@ -1,126 +1,529 @@
+import asyncio
+import pickle
+import threading
+import orjson
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from prophet import Prophet
-from prophet.serialize import model_from_json
+from prophet.serialize import model_from_dict
 from pathlib import Path
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from cachetools import LRUCache
 import pandas as pd
 
 # Import from our other src files
 from .model_training import train_and_save_model
 from .data_ingestion import fetch_data
-from .utils import read_config
+from .utils import read_config, write_atomic, KeyedLocks
 
 
 
 # --- Configuration ---
-app = FastAPI(title="Dynamic Stock Forecast API", version="2.0")
+app = FastAPI(
+    title="Dynamic Stock Forecast API",
+    version="2.0",
+    default_response_class=ORJSONResponse
+)
 
 ROOT_DIR = Path(__file__).resolve().parent.parent
 MODELS_DIR = ROOT_DIR / "models"
 DATA_DIR = ROOT_DIR / "data"
 CONFIG_PATH = ROOT_DIR / "config.yaml"
 
-# This is a cache to hold loaded models in memory
-model_cache = {}
+class ModelCache(LRUCache):
+    """LRU model cache that also forgets the hit count of evicted tickers."""
+    def popitem(self):
+        ticker, model = super().popitem()
+        model_cache_hits.pop(ticker, None)
+        return ticker, model
+
+# This is a cache to hold loaded models in memory. It is bounded, so the
+# least recently used model is evicted once MODEL_CACHE_SIZE is reached.
+# LRUCache isn't thread-safe, so all access goes through model_cache_lock.
+MODEL_CACHE_SIZE = 32
+model_cache = ModelCache(maxsize=MODEL_CACHE_SIZE)
+model_cache_hits = Counter()
+model_cache_lock = threading.Lock()
+
+# One lock per ticker, so concurrent requests for an uncached ticker
+# load its model only once
+model_locks = KeyedLocks()
+
+# This is a cache of forecast records, keyed by ticker. Each entry holds
+# (day, records) for the longest horizon computed so far, and an entry from
+# a previous day counts as a miss. It is bounded like model_cache.
+# Worker threads share it, so all access goes through forecast_cache_lock,
+# and forecast_locks makes simultaneous misses for a ticker predict once.
+forecast_cache = LRUCache(maxsize=MODEL_CACHE_SIZE)
+forecast_cache_lock = threading.Lock()
+forecast_locks = KeyedLocks()
+MIN_FORECAST_DAYS = 365
+MAX_FORECAST_DAYS = 5 * 365
+
+# Each unknown ticker in a batch queues a download and a model fit,
+# so a single batch request is capped at this many tickers
+MAX_BATCH_TICKERS = 20
+
+# Tickers waiting for background training; once the queue is full,
+# requests for new tickers get a 503 instead of queueing more work
+MAX_TRAINING_QUEUE = 10
+
+class ModelNotTrainedError(Exception):
+    """Raised when a ticker has no trained model on disk yet."""
+
+class BatchPredictRequest(BaseModel):
+    """Request body for forecasting several tickers at once."""
+    tickers: list[str] = Field(min_length=1, max_length=MAX_BATCH_TICKERS)
+    days: int = Field(7, ge=1, le=MAX_FORECAST_DAYS)
 
 # --- Model Loading Logic ---
 def get_model_path(ticker: str) -> Path:
     """Gets the path for a given ticker's model file."""
     return MODELS_DIR / f"prophet_model_{ticker}.json"
 
-def load_model(ticker: str):
-    """
-    Loads a model into the cache. If it doesn't exist,
-    it triggers training.
-    """
-    if ticker in model_cache:
-        print(f"Model for {ticker} found in cache.")
-        return model_cache[ticker]
-    
+def get_pickle_path(ticker: str) -> Path:
+    """Gets the path for a given ticker's pickled model file."""
+    return MODELS_DIR / f"prophet_model_{ticker}.pkl"
+
+def get_statsforecast_path(ticker: str) -> Path:
+    """Gets the path for a given ticker's StatsForecast model file."""
+    return MODELS_DIR / f"statsforecast_model_{ticker}.pkl"
+
+def get_forecaster() -> str:
+    """Gets the configured forecaster: 'prophet' or 'statsforecast'."""
+    config = read_config(CONFIG_PATH) or {}
+    return config.get('forecaster', 'prophet')
+
+def get_cached_model(ticker: str):
+    """Returns the cached model for a ticker (recording a hit), or None."""
+    with model_cache_lock:
+        model = model_cache.get(ticker)
+        if model is not None:
+            model_cache_hits[ticker] += 1
+    return model
+
+def load_prophet_model(ticker: str):
+    """Loads a Prophet model from disk."""
     model_path = get_model_path(ticker)
+    pickle_path = get_pickle_path(ticker)
+    
+    if not pickle_path.exists() and not model_path.exists():
+        raise ModelNotTrainedError(ticker)
+    
+    if pickle_path.exists():
+        print(f"Loading model from {pickle_path}...")
+        try:
+            with open(pickle_path, 'rb') as fin:
+                return pickle.load(fin)
+        except Exception as e:
+            # Pickles are environment-specific; the JSON model is portable
+            if not model_path.exists():
+                raise
+            print(f"Could not load {pickle_path} ({e}). Falling back to JSON.")
+    
+    # Legacy JSON-only model (or unreadable pickle): load the JSON,
+    # then try to write a pickle for next time
+    print(f"Loading model from {model_path}...")
+    # orjson parses the (large) model JSON much faster than stdlib json
+    model = model_from_dict(orjson.loads(model_path.read_bytes()))
+    try:
+        write_atomic(pickle_path, pickle.dumps(model, protocol=5))
+    except Exception as e:
+        print(f"Could not write {pickle_path}: {e}")
+    return model
+
+def load_statsforecast_model(ticker: str):
+    """Loads a StatsForecast model from disk."""
+    model_path = get_statsforecast_path(ticker)
     
     if not model_path.exists():
-        print(f"No model found for {ticker}. Starting training...")
-        success = train_and_save_model(ticker)
-        if not success:
-            raise HTTPException(status_code=404, detail=f"Could not train model for ticker {ticker}. Ticker may be invalid.")
+        raise ModelNotTrainedError(ticker)
     
+    print(f"Loading model from {model_path}...")
+    with open(model_path, 'rb') as fin:
+        return pickle.load(fin)
+
+def model_exists(ticker: str) -> bool:
+    """Checks whether a trained model for the ticker is on disk."""
+    if get_forecaster() == 'statsforecast':
+        return get_statsforecast_path(ticker).exists()
+    return get_pickle_path(ticker).exists() or get_model_path(ticker).exists()
+
+def load_model_from_disk(ticker: str):
+    """
+    Loads a ticker's model from disk into the cache.
+    The caller must hold the ticker's lock in model_locks.
+    """
     try:
-        print(f"Loading model from {model_path}...")
-        with open(model_path, 'r') as fin:
-            model = model_from_json(fin.read())
-        model_cache[ticker] = model # Save to cache
+        if get_forecaster() == 'statsforecast':
+            model = load_statsforecast_model(ticker)
+        else:
+            model = load_prophet_model(ticker)
+        with model_cache_lock:
+            model_cache[ticker] = model # Save to cache
         print("Model loaded successfully.")
         return model
+    except ModelNotTrainedError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error loading model for {ticker}: {e}")
 
+def load_model(ticker: str):
+    """
+    Loads a model into the cache. If it hasn't been trained yet,
+    raises ModelNotTrainedError so the caller can queue training.
+    """
+    model = get_cached_model(ticker)
+    if model is not None:
+        print(f"Model for {ticker} found in cache.")
+        return model
+    
+    # Check before taking the lock, so polls for a ticker that is still
+    # training get an answer instead of waiting behind the trainer
+    if not model_exists(ticker):
+        raise ModelNotTrainedError(ticker)
+    
+    with model_locks.hold(ticker):
+        # Another request may have loaded it while we waited for the lock
+        model = get_cached_model(ticker)
+        if model is not None:
+            print(f"Model for {ticker} found in cache.")
+            return model
+        return load_model_from_disk(ticker)
+
+def train_and_load_model(ticker: str) -> bool:
+    """
+    Trains a ticker's model and loads it into the cache. Holds the ticker's
+    lock throughout, so no request loads the files while they are written.
+    Returns True if successful, False otherwise.
+    """
+    with model_locks.hold(ticker):
+        if not train_and_save_model(ticker):
+            return False
+        load_model_from_disk(ticker)
+    return True
+
+def warm_model_cache(tickers: list) -> list:
+    """
+    Loads the models for several tickers concurrently, so the first request
+    for a popular ticker is served from the cache. Returns the tickers that
+    have no trained model yet.
+    """
+    def warm(ticker: str) -> bool:
+        try:
+            load_model(ticker)
+        except ModelNotTrainedError:
+            return False
+        except HTTPException as e:
+            print(f"Could not warm model for {ticker}: {e.detail}")
+        return True
+    
+    print(f"Warming model cache for {tickers}...")
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        loaded = list(executor.map(warm, tickers))
+    print("Model cache warmed.")
+    return [ticker for ticker, ok in zip(tickers, loaded) if not ok]
+
+# --- Background Training ---
+def queue_training(ticker: str) -> bool:
+    """
+    Queues a ticker for training, unless it is already queued.
+    Returns False if the queue is full and the ticker wasn't queued.
+    """
+    if ticker in app.state.training:
+        return True
+    try:
+        app.state.train_queue.put_nowait(ticker)
+    except asyncio.QueueFull:
+        print(f"Training queue is full. Not queueing {ticker}.")
+        return False
+    app.state.training.add(ticker)
+    print(f"Training queued for {ticker}.")
+    return True
+
+async def trainer_loop():
+    """
+    Trains queued tickers one at a time, off the request path, then
+    loads each new model into the cache.
+    """
+    while True:
+        ticker = await app.state.train_queue.get()
+        try:
+            success = await asyncio.to_thread(train_and_load_model, ticker)
+            if not success:
+                app.state.failed_training.add(ticker)
+        except Exception as e:
+            print(f"Background training failed for {ticker}: {e}")
+            app.state.failed_training.add(ticker)
+        finally:
+            app.state.training.discard(ticker)
+            app.state.train_queue.task_done()
+
+async def untrained_error(ticker: str) -> HTTPException:
+    """
+    Returns the error to report for a ticker without a model: 404 if its
+    last training attempt failed, 503 if the training queue is full,
+    otherwise 202 after queueing training.
+    """
+    if ticker in app.state.failed_training:
+        # Report the failure once, so a later request can retry training
+        app.state.failed_training.discard(ticker)
+        return HTTPException(status_code=404, detail=f"Could not train model for ticker {ticker}. Ticker may be invalid.")
+    if not queue_training(ticker):
+        return HTTPException(
+            status_code=503,
+            detail="Too many models are being trained. Try again later.",
+            headers={"Retry-After": "60"}
+        )
+    return HTTPException(
+        status_code=202,
+        detail=f"Model for {ticker} is being trained. Retry this request shortly.",
+        headers={"Retry-After": "30"}
+    )
+
+async def warm_models(tickers: list):
+    """Warms the model cache, then queues training for any untrained tickers."""
+    for ticker in await asyncio.to_thread(warm_model_cache, tickers):
+        queue_training(ticker)
+
+# --- Startup ---
+@app.on_event("startup")
+async def start_trainer():
+    """Starts the background worker that trains models for new tickers."""
+    app.state.train_queue = asyncio.Queue(maxsize=MAX_TRAINING_QUEUE)
+    app.state.training = set()
+    app.state.failed_training = set()
+    app.state.trainer_task = asyncio.create_task(trainer_loop())
+
+@app.on_event("startup")
+async def start_model_warmup():
+    """Warms the model cache in the background without delaying startup."""
+    config = read_config(CONFIG_PATH) or {}
+    tickers = [ticker.upper() for ticker in config.get('warm_tickers', ["SPY"])]
+    app.state.warmup_task = asyncio.create_task(warm_models(tickers))
+
 # --- API Endpoints ---
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Dynamic Stock Forecasting API."}
 
+@app.get("/cache/stats")
+def get_cache_stats():
+    """
+    Returns the model cache usage, so operators can size MODEL_CACHE_SIZE.
+    """
+    # Only iterate the keys: reading the values would mark every model as
+    # recently used and reset the cache's LRU order on each call
+    with model_cache_lock:
+        tickers = list(model_cache)
+        hits = {ticker: model_cache_hits[ticker] for ticker in tickers}
+    
+    is_statsforecast = get_forecaster() == 'statsforecast'
+    models = {}
+    for ticker in tickers:
+        if is_statsforecast:
+            model_file = get_statsforecast_path(ticker)
+        else:
+            pickle_path = get_pickle_path(ticker)
+            model_file = pickle_path if pickle_path.exists() else get_model_path(ticker)
+        models[ticker] = {
+            "hits": hits[ticker],
+            "size_bytes": model_file.stat().st_size if model_file.exists() else None
+        }
+    return {"maxsize": MODEL_CACHE_SIZE, "currsize": len(tickers), "models": models}
+
+def predict_prophet(model: Prophet, periods: int) -> pd.DataFrame:
+    """Forecasts the next `periods` days with a Prophet model."""
+    # Create a dataframe of future dates only; Prophet doesn't need the
+    # history rows to predict, so this keeps predict() proportional to `periods`
+    last_ds = model.history_dates.max()
+    future_df = pd.DataFrame({
+        'ds': pd.date_range(last_ds + pd.Timedelta(days=1), periods=periods, freq='D')
+    })
+    return model.predict(future_df)
+
+def predict_statsforecast(model, periods: int) -> pd.DataFrame:
+    """
+    Forecasts the next `periods` trading days with a StatsForecast model,
+    renaming the output to Prophet's columns. The model steps through
+    business days, so the forecast spans more calendar time than a Prophet
+    forecast of the same length. The 80% level matches Prophet's default
+    interval width.
+    """
+    forecast = model.predict(h=periods, level=[80])
+    # Older statsforecast versions return unique_id as the index
+    if 'ds' not in forecast.columns:
+        forecast = forecast.reset_index()
+    return forecast.rename(columns={
+        'AutoETS': 'yhat',
+        'AutoETS-lo-80': 'yhat_lower',
+        'AutoETS-hi-80': 'yhat_upper'
+    })
+
+def get_cached_forecast(ticker: str, days: int):
+    """Returns the first `days` of today's cached records for a ticker, or None."""
+    with forecast_cache_lock:
+        entry = forecast_cache.get(ticker)
+    if entry is None:
+        return None
+    day, cached = entry
+    if day == date.today() and len(cached) >= days:
+        print(f"Forecast for {ticker} found in cache.")
+        return cached[:days]
+    return None
+
+def generate_forecast(ticker: str, days: int) -> list:
+    """
+    Returns forecast records for the next `days` days, computing and
+    caching a forecast of at least MIN_FORECAST_DAYS on a cache miss.
+    """
+    records = get_cached_forecast(ticker, days)
+    if records is not None:
+        return records
+    
+    with forecast_locks.hold(ticker):
+        # Another request may have computed it while we waited for the lock
+        records = get_cached_forecast(ticker, days)
+        if records is not None:
+            return records
+        
+        records = compute_forecast(ticker, days)
+        with forecast_cache_lock:
+            forecast_cache[ticker] = (date.today(), records)
+    return records[:days]
+
+def compute_forecast(ticker: str, days: int) -> list:
+    """
+    Forecasts at least MIN_FORECAST_DAYS ahead for a ticker and returns
+    the results as records.
+    """
+    model = load_model(ticker)
+    periods = max(days, MIN_FORECAST_DAYS)
+    if isinstance(model, Prophet):
+        forecast = predict_prophet(model, periods)
+    else:
+        forecast = predict_statsforecast(model, periods)
+    
+    # Build the records from NumPy arrays; casting datetime64[D] to str is
+    # a vectorized 'YYYY-MM-DD' format, much faster than .dt.strftime
+    ds = forecast['ds'].to_numpy().astype('datetime64[D]').astype(str)
+    records = [
+        {'ds': d, 'yhat': yhat, 'yhat_lower': lower, 'yhat_upper': upper}
+        for d, yhat, lower, upper in zip(
+            ds.tolist(),
+            forecast['yhat'].to_numpy().tolist(),
+            forecast['yhat_lower'].to_numpy().tolist(),
+            forecast['yhat_upper'].to_numpy().tolist()
+        )
+    ]
+    return records
+
+def iter_ndjson(records: list, chunk_size: int = 64):
+    """
+    Yields records as newline-delimited JSON, grouping lines into chunks
+    so the response isn't sent one tiny write per record.
+    """
+    for start in range(0, len(records), chunk_size):
+        chunk = records[start:start + chunk_size]
+        yield b"".join(orjson.dumps(record) + b"\n" for record in chunk)
+
 @app.get("/predict")
-def predict_forecast(ticker: str, days: int = 7):
+async def predict_forecast(ticker: str, days: int = Query(7, ge=1, le=MAX_FORECAST_DAYS)):
     """
-    Generates a future forecast for the specified ticker and days.
+    Generates a future forecast for the specified ticker and days,
+    streamed as newline-delimited JSON (one record per line).
     """
+    ticker = ticker.upper()
     try:
-        model = load_model(ticker.upper())
-        
-        # Create a future dataframe
-        future_df = model.make_future_dataframe(periods=days, freq='D')
-        forecast = model.predict(future_df)
-        
-        # Extract and return the relevant part
-        response_data = forecast.tail(days)[['ds', 'yhat', 'yhat_lower', 'yhat_upper']]
-        response_data['ds'] = response_data['ds'].dt.strftime('%Y-%m-%d')
+        # Loading and predicting are blocking, so run them in a worker
+        # thread to keep the event loop free for other requests
+        records = await asyncio.to_thread(generate_forecast, ticker, days)
         
-        return response_data.to_dict('records')
+        # Stream the records so the client can start decoding right away
+        return StreamingResponse(iter_ndjson(records), media_type="application/x-ndjson")
         
+    except ModelNotTrainedError:
+        # Training takes too long to wait for, so hand it to the background worker
+        raise await untrained_error(ticker)
     except HTTPException as e:
         # Re-raise HTTPException to return proper error codes
         raise e
     except Exception as e:
-        return HTTPException(status_code=500, detail=f"An error occurred during prediction: {e}")
+        raise HTTPException(status_code=500, detail=f"An error occurred during prediction: {e}")
+
+
+def generate_batch_forecast(tickers: list, days: int) -> dict:
+    """
+    Generates forecasts for several tickers in parallel. A ticker that fails
+    gets an error entry instead of failing the whole batch, and a ticker
+    without a trained model gets None.
+    """
+    def forecast_one(ticker: str):
+        try:
+            return generate_forecast(ticker, days)
+        except ModelNotTrainedError:
+            return None
+        except HTTPException as e:
+            return {"error": e.detail}
+        except Exception as e:
+            return {"error": f"An error occurred during prediction: {e}"}
+    
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        return dict(zip(tickers, executor.map(forecast_one, tickers)))
+
+@app.post("/predict-batch")
+async def predict_batch(request: BatchPredictRequest):
+    """
+    Generates future forecasts for several tickers in a single request.
+    """
+    # Upper-case and de-duplicate, keeping the requested order
+    tickers = list(dict.fromkeys(ticker.upper() for ticker in request.tickers))
+    results = await asyncio.to_thread(generate_batch_forecast, tickers, request.days)
+    for ticker in [t for t, records in results.items() if records is None]:
+        results[ticker] = {"error": (await untrained_error(ticker)).detail}
+    return results
+
+
+def load_historical_data(ticker: str) -> pd.DataFrame:
+    """
+    Updates the data file for a ticker and loads it as a clean DataFrame.
+    """
+    # 1. Ensure data file exists and is up-to-date
+    config = read_config(CONFIG_PATH)
+    params = config['data_ingestion']
+    DATA_PATH = DATA_DIR / f"{ticker}_data.parquet"
+    
+    fetch_data(
+        ticker=ticker,
+        start_date=params['start_date'],
+        end_date=params['end_date'],
+        output_path=DATA_PATH
+    )
+
+    # 2. Load data; Parquet keeps the column types, so no coercion is needed
+    df = pd.read_parquet(DATA_PATH, columns=['Open', 'High', 'Low', 'Close', 'Volume'])
+    df.dropna(subset=['Close'], inplace=True) 
+
+    # Reset index to make 'Date' a column for JSON
+    df.reset_index(inplace=True)
+    # Robust fix: The new date column is the first one, let's rename it.
+    df.rename(columns={df.columns[0]: 'Date'}, inplace=True)
+    return df
 
 
 @app.get("/historical-data")
-def get_historical(ticker: str):
+async def get_historical(ticker: str):
     """
     Fetches and returns historical OHLCV data for a ticker.
     """
     ticker = ticker.upper()
     try:
-        # 1. Ensure data file exists and is up-to-date
-        config = read_config(CONFIG_PATH)
-        params = config['data_ingestion']
-        DATA_PATH = DATA_DIR / f"{ticker}_data.csv"
-        
-        fetch_data(
-            ticker=ticker,
-            start_date=params['start_date'],
-            end_date=params['end_date'],
-            output_path=DATA_PATH
-        )
-
-        # 2. Load and clean data
-        df = pd.read_csv(
-            DATA_PATH, 
-            index_col=0, 
-            parse_dates=True, 
-            date_format='%Y-%m-%d'
-        )
-        
-        # Clean all necessary columns
-        for col in ['Open', 'High', 'Low', 'Close']:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        df.dropna(subset=['Close'], inplace=True) 
-
-        # Reset index to make 'Date' a column for JSON
-        df.reset_index(inplace=True)
-        # Robust fix: The new date column is the first one, let's rename it.
-        df.rename(columns={df.columns[0]: 'Date'}, inplace=True)
+        # Download and file loading both block, so do them in one worker thread
+        df = await asyncio.to_thread(load_historical_data, ticker)
 
         # 3. Return as JSON records
         return df.to_dict('records')
@@ -130,7 +533,6 @@ def get_historical(ticker: str):
     
 # This allows running the app directly
 if __name__ == "__main__":
-    # Pre-load the SPY model on startup
-    load_model("SPY") 
+    # Popular models are pre-loaded by the startup event
     uvicorn.run(app, host="127.0.0.1", port=8000)
     
\ No newline at end of file
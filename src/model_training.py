@@ -1,10 +1,11 @@
+import pickle
 import pandas as pd
 from prophet import Prophet
 from pathlib import Path
 from prophet.serialize import model_to_json
 
 # Import from our other src files
-from .utils import read_config
+from .utils import read_config, write_atomic
 from .data_ingestion import fetch_data
 
 # Define paths
@@ -13,9 +14,30 @@ DATA_DIR = ROOT_DIR / "data"
 MODELS_DIR = ROOT_DIR / "models"
 CONFIG_PATH = ROOT_DIR / "config.yaml"
 
+def train_and_save_statsforecast_model(ticker: str, prophet_df: pd.DataFrame):
+    """
+    Trains a StatsForecast AutoETS model, which fits far faster than Prophet,
+    and pickles it. Requires the optional `statsforecast` package.
+    The data only has trading-day rows, so the model uses the business-day
+    frequency: each step is one trading day and a season is a 5-day week.
+    """
+    from statsforecast import StatsForecast
+    from statsforecast.models import AutoETS
+    
+    print(f"Training StatsForecast AutoETS model for {ticker}...")
+    model = StatsForecast(models=[AutoETS(season_length=5)], freq='B')
+    model.fit(prophet_df.reset_index(drop=True).assign(unique_id=ticker))
+    print("Model training complete.")
+    
+    MODELS_DIR.mkdir(exist_ok=True)
+    model_path = MODELS_DIR / f"statsforecast_model_{ticker}.pkl"
+    write_atomic(model_path, pickle.dumps(model, protocol=5))
+    print(f"Model successfully saved to {model_path}")
+
 def train_and_save_model(ticker: str) -> bool:
     """
-    Trains a Prophet model for a specific ticker and saves it to a file.
+    Trains a model for a specific ticker and saves it to a file, using the
+    forecaster set in the config ('prophet' by default, or 'statsforecast').
     Returns True if successful, False otherwise.
     """
     print(f"Starting model training process for {ticker}...")
@@ -26,7 +48,7 @@ def train_and_save_model(ticker: str) -> bool:
         params = config['data_ingestion']
         
         # 2. Fetch/Update data
-        DATA_PATH = DATA_DIR / f"{ticker}_data.csv"
+        DATA_PATH = DATA_DIR / f"{ticker}_data.parquet"
         fetch_data(
             ticker=ticker,
             start_date=params['start_date'],
@@ -36,13 +58,7 @@ def train_and_save_model(ticker: str) -> bool:
         
         # 3. Load and clean data
         print(f"Loading data from {DATA_PATH}...")
-        df = pd.read_csv(
-            DATA_PATH, 
-            index_col=0, 
-            parse_dates=True, 
-            date_format='%Y-%m-%d'
-        )
-        df['Close'] = pd.to_numeric(df['Close'], errors='coerce')
+        df = pd.read_parquet(DATA_PATH, columns=['Close'])
         df.dropna(subset=['Close'], inplace=True)
         
         if df.empty:
@@ -53,6 +69,10 @@ def train_and_save_model(ticker: str) -> bool:
         prophet_df = pd.DataFrame({'ds': df.index, 'y': df['Close']})
         
         # 5. Train the model
+        if config.get('forecaster', 'prophet') == 'statsforecast':
+            train_and_save_statsforecast_model(ticker, prophet_df)
+            return True
+        
         print(f"Training Prophet model for {ticker}...")
         model = Prophet(yearly_seasonality=True, daily_seasonality=False)
         model.fit(prophet_df)
@@ -62,10 +82,14 @@ def train_and_save_model(ticker: str) -> bool:
         MODELS_DIR.mkdir(exist_ok=True)
         model_path = MODELS_DIR / f"prophet_model_{ticker}.json"
         
-        with open(model_path, 'w') as fout:
-            fout.write(model_to_json(model))
+        # Save a pickle, which is much faster to load than JSON. It goes
+        # first, so a reader never finds the JSON without it and converts
+        # the JSON into a second copy of the pickle. Both writes are atomic.
+        pickle_path = model_path.with_suffix('.pkl')
+        write_atomic(pickle_path, pickle.dumps(model, protocol=5))
+        write_atomic(model_path, model_to_json(model).encode())
             
-        print(f"Model successfully saved to {model_path}")
+        print(f"Model successfully saved to {model_path} and {pickle_path}")
         return True
         
     except Exception as e:
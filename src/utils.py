@@ -1,6 +1,10 @@
 # src/utils.py
 
+import os
+import tempfile
+import threading
 import yaml
+from contextlib import contextmanager
 from pathlib import Path
 
 def read_config(config_path: Path = Path("config.yaml")) -> dict:
@@ -23,4 +27,46 @@ def read_config(config_path: Path = Path("config.yaml")) -> dict:
         return None
     except Exception as e:
         print(f"Error reading the configuration file: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def write_atomic(path: Path, data: bytes):
+    """
+    Writes bytes to a file without ever exposing a partial file: the data
+    goes to a temp file in the same directory, which then replaces `path`.
+
+    Args:
+        path (Path): The file to write.
+        data (bytes): The contents to write.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as fout:
+            fout.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class KeyedLocks:
+    """
+    One lock per key, created on first use and dropped once no thread holds
+    or waits for it, so the map never outgrows the work in flight.
+    """
+    def __init__(self):
+        self._locks = {}  # key -> [lock, number of holders and waiters]
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, key):
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]